@@ -4,208 +4,617 @@ Manage PR Preview Environments on AWS Lightsail
 """
 
 import argparse
+import atexit
+import base64
 import boto3
+import functools
+import gzip
+import http.client
+import json
+import logging
+import random
+import shlex
+import socket
+import string
+import subprocess
+import tempfile
+import textwrap
+import threading
 import time
 import sys
 import os
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import WaiterError
+from botocore.waiter import WaiterModel, create_waiter_with_client
+
+log = logging.getLogger("preview")
+BANNER = "=" * 60
+
+# Lightsail ships no waiters of its own, so define one for "instance running"
+WAITER_DELAY = 5
+INSTANCE_RUNNING_WAITER = WaiterModel({
+    'version': 2,
+    'waiters': {
+        'InstanceRunning': {
+            'operation': 'GetInstance',
+            'delay': WAITER_DELAY,
+            'maxAttempts': 60,
+            'acceptors': [
+                {'matcher': 'path', 'argument': 'instance.state.name',
+                 'expected': 'running', 'state': 'success'},
+                {'matcher': 'path', 'argument': 'instance.state.name',
+                 'expected': 'error', 'state': 'failure'},
+                {'matcher': 'path', 'argument': 'instance.state.name',
+                 'expected': 'terminated', 'state': 'failure'},
+                {'matcher': 'error', 'expected': 'NotFoundException',
+                 'state': 'retry'},
+            ],
+        },
+    },
+})
+
+# Adaptive mode retries throttled calls (ThrottlingException etc.) with backoff
+MAX_POOL_CONNECTIONS = 50
+CLIENT_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+)
+
+# One session and one client per region, shared by every PreviewManager so the
+# service model is loaded once and calls reuse pooled keep-alive connections
+_SESSION = boto3.session.Session()
+_LIGHTSAIL = {}
+
+def get_lightsail_client(region):
+    """Return the shared Lightsail client for a region"""
+    if region not in _LIGHTSAIL:
+        _LIGHTSAIL[region] = _SESSION.client('lightsail', region_name=region, config=CLIENT_CONFIG)
+    return _LIGHTSAIL[region]
+
+MAX_BACKOFF = 30
+
+# Readiness probes poll tightly so they return as soon as the service is up
+PROBE_INTERVAL = 2
+
+# Bound ssh so a stuck remote command can't hang the job; remote scripts may
+# wait on the first-boot package install
+SSH_CONNECT_TIMEOUT = 10
+SSH_TIMEOUT = 600
+
+# Characters Lightsail rejects in instance names
+_NAME_TRANS = str.maketrans({'_': '-', '.': '-'})
+
+# Instances boot from this snapshot when set, skipping the package install
+BASE_SNAPSHOT = os.environ.get('PREVIEW_BASE_SNAPSHOT')
+BLUEPRINT_ID = 'ubuntu_22_04'
+BUNDLE_ID = 'nano_3_0'
+
+# Shell scripts run on the instance; values are shlex-quoted before substitution
+INSTALL_PACKAGES = textwrap.dedent("""\
+    # Install only missing packages, so nothing is touched on a prebuilt snapshot.
+    # The package index is only refreshed if it is more than an hour old.
+    missing=""
+    for pkg in nginx git; do
+        command -v "$pkg" >/dev/null || missing="$missing $pkg"
+    done
+    if [ -n "$missing" ]; then
+        export DEBIAN_FRONTEND=noninteractive
+        if [ -z "$(find /var/lib/apt/periodic/update-success-stamp -mmin -60 2>/dev/null)" ]; then
+            apt-get -o Acquire::Languages=none update -qq
+        fi
+        apt-get install -y -qq --no-install-recommends $missing
+    fi
+""")
+
+BASE_USER_DATA = "#!/bin/bash\nset -e\nexec >> /var/log/user-data.log 2>&1\n\n" + INSTALL_PACKAGES
+
+USER_DATA_TMPL = string.Template(textwrap.dedent("""\
+    #!/bin/bash
+    set -e
+
+    # Redirect output to log file
+    exec >> /var/log/user-data.log 2>&1
+
+    echo "Starting deployment at $$(date)"
+
+    # Clone repository while packages install; Ubuntu images already ship
+    # git, and the install step leaves installed packages alone
+    cd /home/ubuntu
+    clone_pid=""
+    if command -v git >/dev/null; then
+        git clone --depth=1 --single-branch --branch=$branch $repo_url app &
+        clone_pid=$$!
+    fi
+
+    $install_packages
+
+    if [ -n "$$clone_pid" ]; then
+        wait "$$clone_pid"
+    else
+        git clone --depth=1 --single-branch --branch=$branch $repo_url app
+    fi
+    cd app
+
+    # Deploy preview page
+    rm -rf /var/www/html/*
+    cp public/preview.html /var/www/html/index.html
+
+    # Restart nginx
+    systemctl restart nginx
+
+    echo "Deployment completed at $$(date)"
+"""))
+
+DEPLOY_SCRIPT_TMPL = string.Template(textwrap.dedent("""\
+    set -e
+    # Instances created in a batch boot without the app; wait for the
+    # package install and clone it on first deploy. A failed or degraded
+    # first boot must not block redeploys, so the status code is ignored.
+    cloud-init status --wait >/dev/null || true
+    cd /home/ubuntu
+    if [ -d app ]; then
+        cd app
+        git fetch --depth=1 origin $branch
+        git reset --hard FETCH_HEAD
+    else
+        git clone --depth=1 --single-branch --branch=$branch $repo_url app
+        cd app
+    fi
+
+    rm -rf /var/www/html/*
+    cp public/preview.html /var/www/html/index.html
+    systemctl reload nginx
+"""))
+
+def _compress_user_data(script):
+    """Wrap a script in a stub that unpacks its gzipped body to a file and runs it"""
+    payload = base64.b64encode(gzip.compress(script.encode(), mtime=0)).decode()
+    # Run from a file rather than a pipe so commands can't read the script from stdin
+    return (
+        "#!/bin/bash\n"
+        "set -eo pipefail\n"
+        f"echo {payload} | base64 -d | gunzip > /var/lib/preview-user-data.sh\n"
+        "exec bash /var/lib/preview-user-data.sh\n"
+    )
+
+# Scripts depend only on (repo, branch), so retries for the same PR reuse them
+@functools.lru_cache(maxsize=32)
+def _render_user_data(repo_name, branch):
+    """Render the first-boot user data script, gzipped to shrink the create request"""
+    return _compress_user_data(USER_DATA_TMPL.substitute(
+        install_packages=INSTALL_PACKAGES.rstrip(),
+        repo_url=shlex.quote(f"https://github.com/{repo_name}.git"),
+        branch=shlex.quote(branch),
+    ))
+
+@functools.lru_cache(maxsize=32)
+def _render_deploy_script(repo_name, branch):
+    """Render the SSH deploy script"""
+    return DEPLOY_SCRIPT_TMPL.substitute(
+        repo_url=shlex.quote(f"https://github.com/{repo_name}.git"),
+        branch=shlex.quote(branch),
+    )
+
+def _bulk_executor(count):
+    """Thread pool for per-preview work, one thread per preview up to the pool size"""
+    return ThreadPoolExecutor(max_workers=max(1, min(count, MAX_POOL_CONNECTIONS)))
+
+# put_instance_public_ports attempts while a new instance is still registering
+FIREWALL_ATTEMPTS = 5
+
+# create_instances accepts at most 20 instance names per request
+BATCH_SIZE = 20
+
+def _sleep_backoff(attempt, cap=MAX_BACKOFF):
+    """Sleep for a jittered, exponentially growing delay and return it"""
+    delay = min(cap, random.uniform(1, 2 ** attempt))
+    time.sleep(delay)
+    return delay
+
+def _wait_http(ip, port=80, timeout=300):
+    """Poll http://ip:port/ until it serves the preview, return False on timeout"""
+    url = f"http://{ip}:{port}/"
+    deadline = time.time() + timeout
+    attempt = 0
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=PROBE_INTERVAL) as response:
+                # nginx serves its default page until the preview is copied in
+                if response.status == 200 and b'Welcome to nginx' not in response.read():
+                    return True
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            pass
+        attempt += 1
+        _sleep_backoff(attempt, cap=PROBE_INTERVAL)
+    return False
+
+def _wait_tcp(ip, port, timeout=180):
+    """Poll until ip:port accepts TCP connections, return False on timeout"""
+    deadline = time.time() + timeout
+    attempt = 0
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((ip, port), timeout=PROBE_INTERVAL):
+                return True
+        except OSError:
+            pass
+        attempt += 1
+        _sleep_backoff(attempt, cap=PROBE_INTERVAL)
+    return False
+
+def _ssh_command(ip, key_path):
+    """Build an ssh command line that multiplexes over a shared control socket"""
+    control_dir = os.path.expanduser('~/.ssh')
+    os.makedirs(control_dir, mode=0o700, exist_ok=True)
+    return [
+        'ssh',
+        '-i', key_path,
+        '-o', 'StrictHostKeyChecking=no',
+        '-o', 'UserKnownHostsFile=/dev/null',
+        '-o', 'LogLevel=ERROR',
+        '-o', 'BatchMode=yes',
+        '-o', f'ConnectTimeout={SSH_CONNECT_TIMEOUT}',
+        '-o', 'ControlMaster=auto',
+        '-o', 'ControlPersist=60s',
+        '-o', f'ControlPath={control_dir}/cm-%r@%h:%p',
+        '-o', 'TCPKeepAlive=yes',
+        f'ubuntu@{ip}',
+    ]
+
+def _log_banner(title, *lines):
+    """Log a title framed by banner rules, then its detail lines, in one write"""
+    log.info("\n".join((BANNER, title, BANNER) + lines + (BANNER, "")))
 
 class PreviewManager:
     def __init__(self, region='us-east-1'):
-        self.lightsail = boto3.client('lightsail', region_name=region)
+        self.lightsail = get_lightsail_client(region)
         self.region = region
+        self.instance_running = create_waiter_with_client(
+            'InstanceRunning', INSTANCE_RUNNING_WAITER, self.lightsail
+        )
+        self.ssh_key_path = None
+        self.ssh_key_lock = threading.Lock()
     
     def get_instance_name(self, pr_number, repo_name):
         """Generate instance name from PR number and repo"""
         # Clean repo name (remove owner, special chars)
-        clean_repo = repo_name.split('/')[-1].replace('_', '-').replace('.', '-')
+        clean_repo = repo_name.rpartition('/')[2].translate(_NAME_TRANS)
         return f"pr-{pr_number}-{clean_repo}"[:63]  # Lightsail name limit
     
-    def instance_exists(self, instance_name):
-        """Check if instance already exists"""
+    def _get_instance_or_none(self, instance_name):
+        """Return the instance description, or None if it does not exist"""
         try:
-            self.lightsail.get_instance(instanceName=instance_name)
-            return True
+            response = self.lightsail.get_instance(instanceName=instance_name)
         except self.lightsail.exceptions.NotFoundException:
-            return False
+            return None
+        return (response or {}).get('instance')
     
     def create_instance(self, instance_name, pr_number, repo_name, branch):
         """Create new Lightsail instance with user data"""
-        print(f"Creating instance: {instance_name}")
+        log.info(f"Creating instance: {instance_name}")
         
         # Create user data script for deployment
         # This script runs on first boot of the Lightsail instance
-        user_data = f"""#!/bin/bash
-set -e
-
-# Redirect output to log file
-exec >> /var/log/user-data.log 2>&1
-
-echo "Starting deployment at $(date)"
-
-# Update and install packages
-apt-get update -qq
-apt-get install -y nginx git
-
-# Clone repository
-cd /home/ubuntu
-git clone https://github.com/{repo_name}.git app
-cd app
-git checkout {branch}
-
-# Deploy preview page
-rm -rf /var/www/html/*
-cp public/preview.html /var/www/html/index.html
-
-# Restart nginx
-systemctl restart nginx
-
-echo "Deployment completed at $(date)"
-"""
+        user_data = _render_user_data(repo_name, branch)
+        
+        params = dict(
+            instanceNames=[instance_name],
+            availabilityZone=f'{self.region}a',
+            bundleId=BUNDLE_ID,
+            userData=user_data,
+            tags=[
+                {'key': 'Type', 'value': 'PR-Preview'},
+                {'key': 'PR', 'value': str(pr_number)},
+                {'key': 'Repository', 'value': repo_name},
+                {'key': 'Branch', 'value': branch},
+                {'key': 'ManagedBy', 'value': 'GitHub-Actions'}
+            ]
+        )
         
         try:
-            response = self.lightsail.create_instances(
-                instanceNames=[instance_name],
-                availabilityZone=f'{self.region}a',
-                blueprintId='ubuntu_22_04',
-                bundleId='nano_3_0',
-                userData=user_data,
-                tags=[
-                    {'key': 'Type', 'value': 'PR-Preview'},
-                    {'key': 'PR', 'value': str(pr_number)},
-                    {'key': 'Repository', 'value': repo_name},
-                    {'key': 'Branch', 'value': branch},
-                    {'key': 'ManagedBy', 'value': 'GitHub-Actions'}
-                ]
-            )
+            if BASE_SNAPSHOT:
+                self.lightsail.create_instances_from_snapshot(
+                    instanceSnapshotName=BASE_SNAPSHOT, **params
+                )
+            else:
+                self.lightsail.create_instances(blueprintId=BLUEPRINT_ID, **params)
             
-            print(f"✅ Instance creation initiated")
+            log.info("✅ Instance creation initiated")
             return True
             
         except Exception as e:
-            print(f"❌ Failed to create instance: {e}")
+            log.error(f"❌ Failed to create instance: {e}")
+            return False
+    
+    def create_instances_batch(self, specs):
+        """Create instances for several PRs with one create call per 20 names
+        
+        specs is a list of (instance_name, pr_number, repo_name, branch) tuples.
+        The whole batch shares one user data script, so instances only get the
+        packages at boot and each branch is deployed over SSH afterwards.
+        """
+        names = [spec[0] for spec in specs]
+        log.info(f"Creating {len(names)} instances in batches of {BATCH_SIZE}")
+        
+        try:
+            for i in range(0, len(names), BATCH_SIZE):
+                params = dict(
+                    instanceNames=names[i:i + BATCH_SIZE],
+                    availabilityZone=f'{self.region}a',
+                    bundleId=BUNDLE_ID,
+                    userData=BASE_USER_DATA,
+                    tags=[
+                        {'key': 'Type', 'value': 'PR-Preview'},
+                        {'key': 'ManagedBy', 'value': 'GitHub-Actions'}
+                    ]
+                )
+                if BASE_SNAPSHOT:
+                    self.lightsail.create_instances_from_snapshot(
+                        instanceSnapshotName=BASE_SNAPSHOT, **params
+                    )
+                else:
+                    self.lightsail.create_instances(blueprintId=BLUEPRINT_ID, **params)
+            
+            # Per-PR tags differ between instances, so apply them separately
+            def tag(spec):
+                instance_name, pr_number, repo_name, branch = spec
+                self.lightsail.tag_resource(
+                    resourceName=instance_name,
+                    tags=[
+                        {'key': 'PR', 'value': str(pr_number)},
+                        {'key': 'Repository', 'value': repo_name},
+                        {'key': 'Branch', 'value': branch}
+                    ]
+                )
+            with _bulk_executor(len(specs)) as executor:
+                list(executor.map(tag, specs))
+            
+            log.info("✅ Instance creation initiated")
+            return True
+            
+        except Exception as e:
+            log.error(f"❌ Failed to create instances: {e}")
+            return False
+    
+    def create_base_snapshot(self, snapshot_name, max_wait=900):
+        """Build a snapshot with the preview packages preinstalled"""
+        builder = f"{snapshot_name}-builder"[:63]
+        log.info(f"📸 Building base snapshot {snapshot_name} from {builder}")
+        
+        try:
+            self.lightsail.create_instances(
+                instanceNames=[builder],
+                availabilityZone=f'{self.region}a',
+                blueprintId=BLUEPRINT_ID,
+                bundleId=BUNDLE_ID,
+                userData=BASE_USER_DATA,
+                tags=[{'key': 'ManagedBy', 'value': 'GitHub-Actions'}]
+            )
+        except Exception as e:
+            log.error(f"❌ Failed to create builder instance: {e}")
+            return False
+        
+        try:
+            instance_ip = self.wait_for_instance(builder)
+            if not instance_ip or not _wait_tcp(instance_ip, 22):
+                return False
+            # Block until the user data has finished, then check what it installed
+            if not self.run_remote_script(
+                instance_ip,
+                "cloud-init status --wait >/dev/null || true\ncommand -v nginx && command -v git\n",
+            ):
+                log.error(f"❌ Package install failed on {builder}")
+                return False
+            
+            self.lightsail.create_instance_snapshot(
+                instanceSnapshotName=snapshot_name, instanceName=builder
+            )
+            deadline = time.time() + max_wait
+            attempt = 0
+            while time.time() < deadline:
+                response = self.lightsail.get_instance_snapshot(instanceSnapshotName=snapshot_name)
+                state = response['instanceSnapshot']['state']
+                if state == 'available':
+                    log.info(f"✅ Snapshot ready. Set PREVIEW_BASE_SNAPSHOT={snapshot_name}")
+                    return True
+                if state == 'error':
+                    break
+                attempt += 1
+                _sleep_backoff(attempt)
+            log.error(f"❌ Snapshot {snapshot_name} did not become available")
+            return False
+        except Exception as e:
+            log.error(f"❌ Failed to build snapshot {snapshot_name}: {e}")
             return False
+        finally:
+            self.delete_instance(builder)
     
     def wait_for_instance(self, instance_name, max_wait=300):
         """Wait for instance to be running and get IP"""
-        print(f"⏳ Waiting for instance to be ready...")
+        log.info("⏳ Waiting for instance to be ready...")
         
-        start_time = time.time()
-        while (time.time() - start_time) < max_wait:
-            try:
-                response = self.lightsail.get_instance(instanceName=instance_name)
-                instance = response['instance']
-                state = instance['state']['name']
-                
-                print(f"   Status: {state}")
-                
-                if state == 'running' and 'publicIpAddress' in instance:
-                    ip = instance['publicIpAddress']
-                    print(f"✅ Instance ready with IP: {ip}")
-                    return ip
-                
-                time.sleep(10)
-                
-            except Exception as e:
-                print(f"   Waiting... {e}")
-                time.sleep(10)
+        try:
+            self.instance_running.wait(
+                instanceName=instance_name,
+                WaiterConfig={'Delay': WAITER_DELAY, 'MaxAttempts': max(1, max_wait // WAITER_DELAY)}
+            )
+        except WaiterError as e:
+            log.error(f"❌ Instance did not become ready within {max_wait}s: {e}")
+            return None
+        
+        response = self.lightsail.get_instance(instanceName=instance_name)
+        ip = response['instance'].get('publicIpAddress')
+        if not ip:
+            log.error("❌ Instance is running but has no public IP")
+            return None
         
-        print(f"❌ Instance did not become ready within {max_wait}s")
-        return None
+        log.info(f"✅ Instance ready with IP: {ip}")
+        return ip
     
     def configure_firewall(self, instance_name):
         """Open necessary ports"""
-        print(f"🔥 Configuring firewall...")
+        log.info("🔥 Configuring firewall...")
         
+        for attempt in range(1, FIREWALL_ATTEMPTS + 1):
+            try:
+                self.lightsail.put_instance_public_ports(
+                    portInfos=[
+                        {'fromPort': 22, 'toPort': 22, 'protocol': 'tcp'},
+                        {'fromPort': 80, 'toPort': 80, 'protocol': 'tcp'},
+                        {'fromPort': 443, 'toPort': 443, 'protocol': 'tcp'},
+                        {'fromPort': 3000, 'toPort': 3000, 'protocol': 'tcp'},  # Node.js
+                        {'fromPort': 5000, 'toPort': 5000, 'protocol': 'tcp'},  # Python
+                    ],
+                    instanceName=instance_name
+                )
+                log.info("✅ Firewall configured")
+                return True
+            except self.lightsail.exceptions.NotFoundException as e:
+                # A just-created instance may not be registered yet
+                if attempt == FIREWALL_ATTEMPTS:
+                    log.warning(f"⚠️  Firewall configuration failed: {e}")
+                    return False
+                _sleep_backoff(attempt)
+            except Exception as e:
+                log.warning(f"⚠️  Firewall configuration failed: {e}")
+                return False
+    
+    def wait_with_firewall(self, instance_name):
+        """Configure the firewall while waiting for a new instance, return its IP"""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            firewall = executor.submit(self.configure_firewall, instance_name)
+            instance_ip = self.wait_for_instance(instance_name)
+            firewall.result()
+        return instance_ip
+
+    def get_ssh_key(self):
+        """Download the region's default Lightsail key pair once and return its path"""
+        # Parallel deploys share one key file
+        with self.ssh_key_lock:
+            if self.ssh_key_path is not None:
+                return self.ssh_key_path
+            key_pair = self.lightsail.download_default_key_pair()
+            # The private key only lives in a private temp dir removed at exit
+            key_dir = tempfile.TemporaryDirectory(prefix='lightsail-')
+            atexit.register(key_dir.cleanup)
+            path = os.path.join(key_dir.name, 'id.pem')
+            with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+                f.write(key_pair['privateKeyBase64'])
+            self.ssh_key_path = path
+            return self.ssh_key_path
+    
+    def run_remote_script(self, instance_ip, script):
+        """Run a bash script on the instance as root over a single ssh session"""
         try:
-            self.lightsail.put_instance_public_ports(
-                portInfos=[
-                    {'fromPort': 22, 'toPort': 22, 'protocol': 'tcp'},
-                    {'fromPort': 80, 'toPort': 80, 'protocol': 'tcp'},
-                    {'fromPort': 443, 'toPort': 443, 'protocol': 'tcp'},
-                    {'fromPort': 3000, 'toPort': 3000, 'protocol': 'tcp'},  # Node.js
-                    {'fromPort': 5000, 'toPort': 5000, 'protocol': 'tcp'},  # Python
-                ],
-                instanceName=instance_name
-            )
-            print("✅ Firewall configured")
-            return True
+            key_path = self.get_ssh_key()
         except Exception as e:
-            print(f"⚠️  Firewall configuration failed: {e}")
+            log.error(f"❌ Failed to download SSH key: {e}")
+            return False
+        command = _ssh_command(instance_ip, key_path) + ['sudo bash -s']
+        try:
+            result = subprocess.run(command, input=script, text=True, timeout=SSH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            log.error(f"❌ Remote script on {instance_ip} timed out after {SSH_TIMEOUT}s")
             return False
+        return result.returncode == 0
 
-    def deploy_application(self, instance_name, instance_ip, repo_name, branch, commit_sha):
+    def deploy_application(self, instance_name, instance_ip, repo_name, branch, commit_sha,
+                           redeploy=False, max_wait=300):
         """Deploy application to instance"""
-        print(f"📦 Application deployment initiated via user data...")
-        print(f"⏳ Waiting for deployment to complete (this may take 2-3 minutes)...")
+        if redeploy:
+            log.info(f"📦 Redeploying {branch} over SSH...")
+            if not _wait_tcp(instance_ip, 22):
+                log.error(f"❌ SSH did not become reachable on {instance_ip}")
+                return False
+            
+            deploy_script = _render_deploy_script(repo_name, branch)
+            if not self.run_remote_script(instance_ip, deploy_script):
+                log.error("❌ Deployment script failed")
+                return False
+        else:
+            log.info("📦 Application deployment initiated via user data...")
+        log.info("⏳ Waiting for deployment to complete (this may take 2-3 minutes)...")
         
-        # Wait for deployment to complete
-        time.sleep(120)  # Give time for user data script to run
+        if not _wait_http(instance_ip, timeout=max_wait):
+            log.error(f"❌ Deployment did not respond within {max_wait}s")
+            return False
         
-        print(f"✅ Deployment should be complete. Check {instance_ip} in your browser.")
+        log.info(f"✅ Deployment complete. Check {instance_ip} in your browser.")
         return True
+
     def delete_instance(self, instance_name):
         """Delete Lightsail instance"""
-        print(f"🗑️  Deleting instance: {instance_name}")
+        log.info(f"🗑️  Deleting instance: {instance_name}")
         
         try:
             self.lightsail.delete_instance(instanceName=instance_name)
-            print(f"✅ Instance deletion initiated")
+            log.info("✅ Instance deletion initiated")
             return True
         except self.lightsail.exceptions.NotFoundException:
-            print(f"⚠️  Instance not found (may already be deleted)")
+            log.warning("⚠️  Instance not found (may already be deleted)")
             return True
         except Exception as e:
-            print(f"❌ Failed to delete instance: {e}")
+            log.error(f"❌ Failed to delete instance: {e}")
             return False
     
     def create_preview(self, pr_number, repo_name, branch, commit_sha):
         """Create or update preview environment"""
         instance_name = self.get_instance_name(pr_number, repo_name)
         
-        print(f"{'='*60}")
-        print(f"🚀 Creating Preview Environment")
-        print(f"{'='*60}")
-        print(f"PR Number: {pr_number}")
-        print(f"Repository: {repo_name}")
-        print(f"Branch: {branch}")
-        print(f"Commit: {commit_sha[:7]}")
-        print(f"Instance: {instance_name}")
-        print(f"{'='*60}\n")
+        _log_banner(
+            "🚀 Creating Preview Environment",
+            f"PR Number: {pr_number}",
+            f"Repository: {repo_name}",
+            f"Branch: {branch}",
+            f"Commit: {commit_sha[:7]}",
+            f"Instance: {instance_name}",
+        )
         
         # Check if instance exists
-        if self.instance_exists(instance_name):
-            print(f"ℹ️  Instance already exists, will update deployment")
-            response = self.lightsail.get_instance(instanceName=instance_name)
-            instance_ip = response['instance']['publicIpAddress']
+        instance = self._get_instance_or_none(instance_name)
+        redeploy = instance is not None
+        if redeploy:
+            log.info("ℹ️  Instance already exists, will update deployment")
+            # A freshly created instance may not have its public IP yet
+            instance_ip = instance.get('publicIpAddress') or self.wait_for_instance(instance_name)
+            if not instance_ip:
+                sys.exit(1)
         else:
             # Create new instance
             if not self.create_instance(instance_name, pr_number, repo_name, branch):
                 sys.exit(1)
             
-            # Wait for instance to be ready
-            instance_ip = self.wait_for_instance(instance_name)
+            # Configure firewall while waiting for the instance to be ready
+            instance_ip = self.wait_with_firewall(instance_name)
             if not instance_ip:
                 sys.exit(1)
-            
-            # Configure firewall
-            self.configure_firewall(instance_name)
         
         # Deploy application
-        self.deploy_application(instance_name, instance_ip, repo_name, branch, commit_sha)
+        if not self.deploy_application(instance_name, instance_ip, repo_name, branch, commit_sha,
+                                       redeploy=redeploy):
+            return False
         
         # Output for GitHub Actions
-        print(f"\n{'='*60}")
-        print(f"✅ Preview Environment Ready!")
-        print(f"{'='*60}")
-        print(f"URL: http://{instance_ip}/")
-        print(f"Instance: {instance_name}")
+        _log_banner(
+            "✅ Preview Environment Ready!",
+            f"URL: http://{instance_ip}/",
+            f"Instance: {instance_name}",
+        )
         
         # Set GitHub Actions outputs
-        if os.getenv('GITHUB_OUTPUT'):
-            with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
-                f.write(f"preview_url=http://{instance_ip}/\n")
-                f.write(f"instance_ip={instance_ip}\n")
-                f.write(f"instance_name={instance_name}\n")
+        github_output = os.environ.get('GITHUB_OUTPUT')
+        if github_output:
+            payload = (
+                f"preview_url=http://{instance_ip}/\n"
+                f"instance_ip={instance_ip}\n"
+                f"instance_name={instance_name}\n"
+            )
+            with open(github_output, 'ab', buffering=0) as f:
+                f.write(payload.encode())
         
         return True
     
@@ -213,41 +622,125 @@ echo "Deployment completed at $(date)"
         """Delete preview environment"""
         instance_name = self.get_instance_name(pr_number, repo_name)
         
-        print(f"{'='*60}")
-        print(f"🧹 Cleaning Up Preview Environment")
-        print(f"{'='*60}")
-        print(f"PR Number: {pr_number}")
-        print(f"Instance: {instance_name}")
-        print(f"{'='*60}\n")
+        _log_banner(
+            "🧹 Cleaning Up Preview Environment",
+            f"PR Number: {pr_number}",
+            f"Instance: {instance_name}",
+        )
         
         return self.delete_instance(instance_name)
+    
+    def delete_previews(self, pr_numbers, repo_name):
+        """Delete several preview environments in parallel"""
+        instance_names = [self.get_instance_name(pr, repo_name) for pr in pr_numbers]
+        
+        _log_banner(
+            "🧹 Cleaning Up Preview Environments",
+            f"PR Numbers: {', '.join(str(pr) for pr in pr_numbers)}",
+        )
+        
+        with _bulk_executor(len(instance_names)) as executor:
+            return all(executor.map(self.delete_instance, instance_names))
+
+    def create_previews(self, specs):
+        """Create or update several preview environments at once
+        
+        specs is a list of (pr_number, repo_name, branch, commit_sha) tuples.
+        """
+        _log_banner(
+            "🚀 Creating Preview Environments",
+            f"PR Numbers: {', '.join(str(spec[0]) for spec in specs)}",
+        )
+        
+        names = [self.get_instance_name(spec[0], spec[1]) for spec in specs]
+        with _bulk_executor(len(names)) as executor:
+            existing = dict(zip(names, executor.map(self._get_instance_or_none, names)))
+        
+        new_instances = [
+            (instance_name, pr_number, repo_name, branch)
+            for instance_name, (pr_number, repo_name, branch, commit_sha) in zip(names, specs)
+            if existing[instance_name] is None
+        ]
+        if new_instances and not self.create_instances_batch(new_instances):
+            return False
+        
+        def deploy(spec):
+            pr_number, repo_name, branch, commit_sha = spec
+            instance_name = self.get_instance_name(pr_number, repo_name)
+            instance = existing[instance_name]
+            # Keep failures per preview so one error doesn't abort the batch
+            try:
+                if instance is None:
+                    instance_ip = self.wait_with_firewall(instance_name)
+                else:
+                    # A freshly created instance may not have its public IP yet
+                    instance_ip = instance.get('publicIpAddress') or self.wait_for_instance(instance_name)
+                if not instance_ip:
+                    return False
+                return self.deploy_application(instance_name, instance_ip, repo_name, branch, commit_sha,
+                                               redeploy=True)
+            except Exception as e:
+                log.error(f"❌ Failed to deploy {instance_name}: {e}")
+                return False
+        
+        with _bulk_executor(len(specs)) as executor:
+            return all(executor.map(deploy, specs))
 
 def main():
     parser = argparse.ArgumentParser(description='Manage PR Preview Environments')
-    parser.add_argument('action', choices=['create', 'delete'], help='Action to perform')
-    parser.add_argument('--pr-number', required=True, type=int, help='Pull request number')
-    parser.add_argument('--repo-name', required=True, help='Repository name (owner/repo)')
+    parser.add_argument('action', choices=['create', 'create-batch', 'delete', 'snapshot'], help='Action to perform')
+    parser.add_argument('--pr-number', type=int, nargs='+',
+                        help='Pull request number (delete accepts several)')
+    parser.add_argument('--repo-name', help='Repository name (owner/repo)')
     parser.add_argument('--branch', help='Branch name (required for create)')
     parser.add_argument('--commit-sha', help='Commit SHA (required for create)')
+    parser.add_argument('--snapshot-name', default='pr-preview-base',
+                        help='Base snapshot to build (snapshot action)')
     parser.add_argument('--region', default='us-east-1', help='AWS region')
     
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     
     manager = PreviewManager(region=args.region)
     
+    if args.action == 'snapshot':
+        sys.exit(0 if manager.create_base_snapshot(args.snapshot_name) else 1)
+    
+    if args.action == 'create-batch':
+        # JSON list of {"pr_number", "repo_name", "branch", "commit_sha"} objects
+        try:
+            specs = [
+                (int(spec['pr_number']), spec['repo_name'], spec['branch'], spec['commit_sha'])
+                for spec in json.load(sys.stdin)
+            ]
+        except (ValueError, TypeError, KeyError) as e:
+            log.error(f"❌ create-batch expects a JSON list of pr_number/repo_name/branch/commit_sha objects: {e}")
+            sys.exit(1)
+        sys.exit(0 if manager.create_previews(specs) else 1)
+    
+    if not args.pr_number or not args.repo_name:
+        log.error(f"❌ --pr-number and --repo-name are required for {args.action} action")
+        sys.exit(1)
+    
     if args.action == 'create':
         if not args.branch or not args.commit_sha:
-            print("❌ --branch and --commit-sha are required for create action")
+            log.error("❌ --branch and --commit-sha are required for create action")
+            sys.exit(1)
+        if len(args.pr_number) != 1:
+            log.error("❌ create accepts a single --pr-number")
             sys.exit(1)
         
         success = manager.create_preview(
-            args.pr_number,
+            args.pr_number[0],
             args.repo_name,
             args.branch,
             args.commit_sha
         )
     else:  # delete
-        success = manager.delete_preview(args.pr_number, args.repo_name)
+        if len(args.pr_number) == 1:
+            success = manager.delete_preview(args.pr_number[0], args.repo_name)
+        else:
+            success = manager.delete_previews(args.pr_number, args.repo_name)
     
     sys.exit(0 if success else 1)
 